@@ -1,10 +1,76 @@
 import pandas as pd
 import numpy as np
-import statsmodels.api as sm
+import bottleneck as bn
+import numexpr as ne
 from statsmodels.tsa.stattools import adfuller
+from numba import njit
 import sqlite3
+import threading
 
 DB_NAME = "market_data.db"
+# Bar widths for the dashboard's resample intervals, in milliseconds (the tick timestamp unit)
+TIMEFRAME_MS = {'1S': 1_000, '1Min': 60_000, '5Min': 300_000}
+
+# One read-only connection reused by every query; Streamlit sessions run in
+# separate threads, so access is serialized with a lock.
+_read_conn = None
+_read_lock = threading.Lock()
+
+def _get_read_connection():
+    """Opens the shared read-only connection on first use."""
+    global _read_conn
+    if _read_conn is None:
+        conn = sqlite3.connect(f"file:{DB_NAME}?mode=ro", uri=True, check_same_thread=False)
+        conn.execute("PRAGMA mmap_size=268435456")  # 256 MiB
+        _read_conn = conn
+    return _read_conn
+
+@njit(cache=True)
+def _resample_ohlc(ts, price, bucket_width):
+    """
+    OHLC bars from time-sorted integer timestamps in one pass (ts and bucket_width
+    share a unit). Emits only buckets that contain trades, so the output is at
+    most len(ts) long.
+    """
+    n = len(ts)
+    starts = np.empty(n, dtype=np.int64)
+    o = np.empty(n)
+    h = np.empty(n)
+    l = np.empty(n)
+    c = np.empty(n)
+    
+    k = -1
+    for i in range(n):
+        bucket = ts[i] - ts[i] % bucket_width
+        p = price[i]
+        if k < 0 or bucket != starts[k]:
+            # New bar
+            k += 1
+            starts[k] = bucket
+            o[k] = p
+            h[k] = p
+            l[k] = p
+        else:
+            if p > h[k]: h[k] = p
+            if p < l[k]: l[k] = p
+        c[k] = p
+        
+    k += 1
+    return starts[:k], o[:k], h[:k], l[:k], c[:k]
+
+def get_latest_timestamp(symbol):
+    """
+    Returns the newest tick timestamp stored for a symbol (None if there is none).
+    Cheap thanks to the (symbol, timestamp) primary key; used as a cache key by the dashboard.
+    """
+    try:
+        with _read_lock:
+            row = _get_read_connection().execute(
+                "SELECT MAX(timestamp) FROM trades WHERE symbol = ?", (symbol,)).fetchone()
+        return row[0]
+    except Exception as e:
+        print(f"Analytics Error: {e}")
+        return None
 
 def load_data(symbol, timeframe='1Min', limit=10000):
     """
@@ -12,95 +78,117 @@ def load_data(symbol, timeframe='1Min', limit=10000):
     [Requirement: Sampling for selectable timeframes]
     """
     try:
-        conn = sqlite3.connect(DB_NAME)
-        # Fetch last N ticks to keep performance fast
-        query = f"""
+        # Fetch last N ticks to keep performance fast. The table is clustered
+        # on (symbol, timestamp, trade_id), so this walks the primary key backwards.
+        query = """
             SELECT timestamp, price 
             FROM trades 
-            WHERE symbol = '{symbol}' 
-            ORDER BY timestamp DESC 
-            LIMIT {limit}
+            WHERE symbol = ? 
+            ORDER BY timestamp DESC, trade_id DESC 
+            LIMIT ?
         """
-        df = pd.read_sql(query, conn)
-        conn.close()
+        with _read_lock:
+            df = pd.read_sql(query, _get_read_connection(), params=(symbol, limit))
         
         if df.empty:
             return pd.DataFrame()
 
-        # Convert to datetime and sort
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        df = df.sort_values('timestamp')
-        df.set_index('timestamp', inplace=True)
+        # Rows arrive newest-first in key order: reverse instead of sorting.
+        # Timestamps are epoch ms integers, so no datetime parsing is needed.
+        ts_ms = np.ascontiguousarray(df['timestamp'].to_numpy(dtype=np.int64)[::-1])
+        price = np.ascontiguousarray(df['price'].to_numpy(dtype=np.float64)[::-1])
         
         # Resample to the requested timeframe (1S, 1Min, 5Min)
         # We use the 'last' price for Close
-        resampled = df['price'].resample(timeframe).ohlc()
+        starts, o, h, l, c = _resample_ohlc(ts_ms, price, TIMEFRAME_MS[timeframe])
         
-        # Drop gaps (periods with no trades)
-        resampled.dropna(inplace=True)
-        
-        return resampled
+        # Only non-empty buckets are emitted, so there are no gaps to drop.
+        # Pin the index to ns: pandas >= 2 would otherwise keep the ms unit.
+        index = pd.DatetimeIndex(starts.astype('datetime64[ms]').astype('datetime64[ns]'), name='timestamp')
+        return pd.DataFrame({'open': o, 'high': h, 'low': l, 'close': c}, index=index)
     except Exception as e:
         print(f"Analytics Error: {e}")
         return pd.DataFrame()
 
-def calculate_ols_hedge_ratio(series_y, series_x):
+def calculate_ols_hedge_ratio(y_arr, x_arr):
     """
     Calculates the Hedge Ratio (Beta) using Ordinary Least Squares.
+    Expects two pre-aligned float arrays (same bars, no gaps).
     [Requirement: Hedge ratio via OLS regression]
     """
-    # Align timestamps
-    df = pd.concat([series_y, series_x], axis=1).dropna()
-    if df.empty or len(df) < 5: 
+    if len(y_arr) < 5: 
         return 0.0
     
-    Y = df.iloc[:, 0]
-    X = sm.add_constant(df.iloc[:, 1]) # Add intercept
-    
-    try:
-        model = sm.OLS(Y, X).fit()
-        return model.params.iloc[1] # Return the slope (beta)
-    except:
+    # Slope of Y = a + b*X (with intercept) is Cov(X, Y) / Var(X)
+    x = x_arr - x_arr.mean()
+    y = y_arr - y_arr.mean()
+    var_x = np.dot(x, x)
+    if var_x == 0:
         return 0.0
+    return float(np.dot(x, y) / var_x)
 
-def calculate_spread(series_y, series_x, hedge_ratio):
+def calculate_spread(y_arr, x_arr, hedge_ratio, out=None):
     """
     Computes the Spread: Y - (Beta * X)
+    `out` is an optional float64 buffer of the same length to write into.
     [Requirement: Spread]
     """
-    df = pd.concat([series_y, series_x], axis=1).dropna()
-    if df.empty: return pd.Series()
-    return df.iloc[:, 0] - (hedge_ratio * df.iloc[:, 1])
+    return ne.evaluate("y - beta * x", local_dict={'y': y_arr, 'x': x_arr, 'beta': hedge_ratio}, out=out)
 
-def calculate_zscore(spread, window=20):
+def calculate_zscore(spread, window=20, out=None):
     """
     Computes Rolling Z-Score.
+    `out` is an optional float64 buffer of the same length to write into.
     [Requirement: Z-score]
     """
-    if spread.empty: return pd.Series()
+    if len(spread) == 0: return np.empty(0)
     
-    mean = spread.rolling(window=window).mean()
-    std = spread.rolling(window=window).std()
+    # Single-pass moving window kernels instead of two pandas rolling passes
+    arr = np.ascontiguousarray(spread, dtype=np.float64)
+    mean = bn.move_mean(arr, window, min_count=window)
+    std = bn.move_std(arr, window, min_count=window, ddof=1)
     
-    z_score = (spread - mean) / std
-    return z_score.fillna(0)
+    # Fused (s - m) / sd: one blocked pass, no intermediate array
+    z_score = ne.evaluate("(s - m) / sd", local_dict={'s': arr, 'm': mean, 'sd': std}, out=out)
+    z_score[np.isnan(z_score)] = 0
+    return z_score
 
-def calculate_rolling_correlation(series_y, series_x, window=20):
+def calculate_rolling_correlation(y_arr, x_arr, window=20):
     """
     Computes Rolling Correlation.
     [Requirement: Rolling correlation]
     """
-    df = pd.concat([series_y, series_x], axis=1).dropna()
-    if df.empty: return pd.Series()
+    if len(y_arr) == 0: return np.empty(0)
+    
+    # Pearson correlation from moving sums. Demean first so the sums of
+    # squares don't lose precision to the price level.
+    y = y_arr - y_arr.mean()
+    x = x_arr - x_arr.mean()
+    
+    sy = bn.move_sum(y, window, min_count=window)
+    sx = bn.move_sum(x, window, min_count=window)
+    syy = bn.move_sum(y * y, window, min_count=window)
+    sxx = bn.move_sum(x * x, window, min_count=window)
+    sxy = bn.move_sum(x * y, window, min_count=window)
     
-    return df.iloc[:, 0].rolling(window=window).corr(df.iloc[:, 1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (window * sxy - sx * sy) / np.sqrt((window * syy - sy * sy) * (window * sxx - sx * sx))
+
+def calculate_returns_correlation(prices):
+    """
+    Correlation matrix of simple returns for an (N symbols, T bars) price array.
+    [Requirement: Heatmap]
+    """
+    prices = np.ascontiguousarray(prices, dtype=np.float64)
+    returns = np.diff(prices, axis=1) / prices[:, :-1]
+    return np.corrcoef(returns)
 
 def perform_adf_test(spread):
     """
     Augmented Dickey-Fuller Test for Mean Reversion.
     [Requirement: ADF test]
     """
-    clean_spread = spread.dropna()
+    clean_spread = spread[~np.isnan(spread)]
     if len(clean_spread) < 20: 
         return None # Not enough data
     
@@ -114,40 +202,63 @@ def perform_adf_test(spread):
     except:
         return None
 
-def run_backtest(spread, zscore, entry_threshold=2.0):
+@njit(cache=True)
+def _backtest(spread, z, entry_threshold):
     """
-    Simulates a strategy: Short Spread if Z > 2, Long Spread if Z < -2.
-    [Requirement: Mini mean-reversion backtest]
+    Backtest kernel for run_backtest: position state machine plus PnL in one pass.
+    Returns positions (0=Flat, 1=Long, -1=Short), spread change, per-bar PnL and
+    cumulative PnL. The first bar has no prior position, so its PnL is NaN.
     """
-    df = pd.DataFrame({'spread': spread, 'z': zscore})
-    df['position'] = 0 
-    
-    current_pos = 0 # 0=Flat, 1=Long, -1=Short
-    positions = []
+    n = len(z)
+    positions = np.zeros(n, dtype=np.int8)
+    spread_change = np.full(n, np.nan)
+    pnl = np.full(n, np.nan)
+    cumulative_pnl = np.full(n, np.nan)
+    current_pos = 0
+    running = 0.0
     
-    for i in range(len(df)):
-        z = df.iloc[i]['z']
+    for i in range(n):
+        # PnL: yesterday's position * change in spread
+        if i > 0:
+            spread_change[i] = spread[i] - spread[i - 1]
+            pnl[i] = current_pos * spread_change[i]
+            # NaN bars are skipped, like pandas' cumsum
+            if not np.isnan(pnl[i]):
+                running += pnl[i]
+                cumulative_pnl[i] = running
         
         # Entry Logic
         if current_pos == 0:
-            if z > entry_threshold: 
+            if z[i] > entry_threshold: 
                 current_pos = -1 # Sell Spread
-            elif z < -entry_threshold: 
+            elif z[i] < -entry_threshold: 
                 current_pos = 1  # Buy Spread
         
         # Exit Logic (Mean Reversion)
-        elif current_pos == -1 and z <= 0: 
+        elif current_pos == -1 and z[i] <= 0: 
             current_pos = 0
-        elif current_pos == 1 and z >= 0: 
+        elif current_pos == 1 and z[i] >= 0: 
             current_pos = 0
             
-        positions.append(current_pos)
+        positions[i] = current_pos
         
-    df['position'] = positions
-    
-    # Calculate PnL: Position * Change in Spread
-    df['spread_change'] = df['spread'].diff()
-    df['pnl'] = df['position'].shift(1) * df['spread_change']
-    df['cumulative_pnl'] = df['pnl'].cumsum()
+    return positions, spread_change, pnl, cumulative_pnl
+
+def run_backtest(spread, zscore, entry_threshold=2.0, index=None):
+    """
+    Simulates a strategy: Short Spread if Z > 2, Long Spread if Z < -2.
+    Takes spread/z-score arrays; index (e.g. the bar timestamps) labels the result.
+    [Requirement: Mini mean-reversion backtest]
+    """
+    spread = np.ascontiguousarray(spread, dtype=np.float64)
+    z = np.ascontiguousarray(zscore, dtype=np.float64)
+    positions, spread_change, pnl, cumulative_pnl = _backtest(spread, z, float(entry_threshold))
     
-    return df
\ No newline at end of file
+    return pd.DataFrame({
+        'spread': spread,
+        'z': z,
+        'position': positions,
+        'spread_change': spread_change,
+        'pnl': pnl,
+        'cumulative_pnl': cumulative_pnl
+    }, index=index)
\ No newline at end of file
@@ -2,16 +2,23 @@ import streamlit as st
 import plotly.graph_objects as go
 import plotly.express as px  
 from plotly.subplots import make_subplots
-import pandas as pd
+import numpy as np
 import time
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from tsdownsample import LTTBDownsampler
 
 
 from analytics import (
     load_data, 
+    get_latest_timestamp,
     calculate_ols_hedge_ratio, 
     calculate_spread, 
     calculate_zscore, 
     calculate_rolling_correlation, 
+    calculate_returns_correlation,
     perform_adf_test,
     run_backtest
 )
@@ -49,8 +56,145 @@ auto_refresh = st.sidebar.checkbox("Enable Live Refresh", value=True)
 refresh_rate = st.sidebar.slider("Refresh Rate (seconds)", 1, 10, 2)
 
 # --- DATA LOADING & PROCESSING ---
-df_y = load_data(symbol_y, timeframe)
-df_x = load_data(symbol_x, timeframe)
+@st.cache_data(max_entries=16)
+def load_data_cached(symbol, timeframe, latest_ts):
+    """
+    Cached load_data. latest_ts is only part of the cache key: reruns with no
+    new ticks (widget changes, idle refreshes) skip the SQLite read and resample.
+    """
+    return load_data(symbol, timeframe)
+
+# The ADF regression runs in a worker process; its result may lag the charts by this much
+ADF_REFRESH_SECONDS = 30
+
+@st.cache_resource
+def get_adf_executor():
+    """Single worker process for the ADF test, shared across reruns and sessions."""
+    # spawn, not fork: forking Streamlit's multi-threaded server can deadlock the child
+    return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+
+def poll_adf_test(spread, data_key):
+    """
+    Returns the most recent finished ADF result for the selected pair + timeframe and
+    submits a new background run when none is pending, the last one is stale and
+    the data has changed since it was submitted.
+    """
+    state = st.session_state
+    selection = (data_key.symbol_y, data_key.symbol_x, data_key.timeframe)
+    if state.get('adf_selection') != selection:
+        # Selection changed: the previous result no longer applies
+        state.adf_selection = selection
+        state.adf_result = None
+        state.adf_future = None
+        state.adf_submitted_at = 0.0
+        state.adf_data_key = None
+    
+    future = state.adf_future
+    if future is not None and future.done():
+        try:
+            state.adf_result = future.result(timeout=0)
+        except BrokenProcessPool as e:
+            # Worker died: drop the cached pool so the next submit gets a fresh one
+            print(f"ADF Error: {e}")
+            get_adf_executor.clear()
+            state.adf_result = None
+        except Exception as e:
+            print(f"ADF Error: {e}")
+            state.adf_result = None
+        state.adf_future = future = None
+    
+    if (future is None and state.adf_data_key != data_key
+            and time.time() - state.adf_submitted_at > ADF_REFRESH_SECONDS):
+        try:
+            state.adf_future = get_adf_executor().submit(perform_adf_test, spread.copy())
+        except BrokenProcessPool as e:
+            print(f"ADF Error: {e}")
+            get_adf_executor.clear()
+            state.adf_result = None
+        else:
+            state.adf_data_key = data_key
+        state.adf_submitted_at = time.time()
+    
+    return state.adf_result
+
+# Max points per chart trace sent to the browser (about the chart's pixel width)
+PLOT_POINTS = 1500
+lttb = LTTBDownsampler()
+
+def downsample(index, values, n_out=PLOT_POINTS):
+    """
+    Reduces a series to at most n_out points with LTTB (largest-triangle-three-buckets),
+    which keeps the visual shape. NaNs (e.g. rolling warm-up) are dropped first.
+    Returns the (x, y) pair for a trace.
+    """
+    if len(values) <= n_out:
+        return index, values
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid) > n_out:
+        valid = valid[lttb.downsample(index.asi8[valid], values[valid], n_out=n_out)]
+    return index[valid], values[valid]
+
+def build_main_figure(symbol_y, symbol_x, z_threshold):
+    """
+    Creates the 5-row chart with empty traces, in the order the dashboard fills them:
+    price Y, price X, spread, z-score, correlation, cumulative PnL.
+    """
+    fig = make_subplots(
+        rows=5, cols=1, 
+        shared_xaxes=True, 
+        vertical_spacing=0.03,
+        subplot_titles=(
+            "Price Action", 
+            "Spread (Residuals)", 
+            "Z-Score (Standardized)", 
+            "Rolling Correlation", 
+            "Backtest Cumulative PnL"
+        )
+    )
+    
+    # 1. Price
+    fig.add_trace(go.Scatter(name=symbol_y), row=1, col=1)
+    fig.add_trace(go.Scatter(name=symbol_x), row=1, col=1)
+    # 2. Spread
+    fig.add_trace(go.Scatter(name="Spread", line=dict(color='orange')), row=2, col=1)
+    # 3. Z-Score
+    fig.add_trace(go.Scatter(name="Z-Score", line=dict(color='blue')), row=3, col=1)
+    fig.add_hline(y=z_threshold, line_dash="dash", line_color="red", row=3, col=1)
+    fig.add_hline(y=-z_threshold, line_dash="dash", line_color="red", row=3, col=1)
+    # 4. Correlation
+    fig.add_trace(go.Scatter(name="Corr", line=dict(color='purple')), row=4, col=1)
+    # 5. PnL
+    fig.add_trace(go.Scatter(name="PnL", fill='tozeroy', line=dict(color='green')), row=5, col=1)
+    
+    fig.update_layout(height=1100, template="plotly_dark", margin=dict(l=20, r=20, t=40, b=20),
+                      uirevision=f"{symbol_y}-{symbol_x}")
+    return fig
+
+def scratch_buffer(name, n):
+    """Float64 work array kept in session_state and reused while the length is unchanged."""
+    buf = st.session_state.get(name)
+    if buf is None or len(buf) != n:
+        buf = st.session_state[name] = np.empty(n)
+    return buf
+
+# --- CACHED ANALYTICS ---
+# Cheap fingerprint of the aligned price arrays: new ticks change the bar count, the
+# first/last bar or the last closes. The arrays themselves are passed as _-prefixed
+# arguments, which st.cache_data skips when hashing; a hit still unpickles a copy of
+# the cached return value. Spread and z-score are not cached: they are single fused
+# numexpr passes into the session's scratch buffers, cheaper than that round trip.
+DataKey = namedtuple('DataKey', ['symbol_y', 'symbol_x', 'timeframe', 'n', 'first_ts', 'last_ts', 'last_y', 'last_x'])
+
+@st.cache_data(max_entries=4)
+def cached_hedge_ratio(_y_arr, _x_arr, data_key):
+    return calculate_ols_hedge_ratio(_y_arr, _x_arr)
+
+@st.cache_data(max_entries=4)
+def cached_rolling_correlation(_y_arr, _x_arr, window, data_key):
+    return calculate_rolling_correlation(_y_arr, _x_arr, window=window)
+
+df_y = load_data_cached(symbol_y, timeframe, get_latest_timestamp(symbol_y))
+df_x = load_data_cached(symbol_x, timeframe, get_latest_timestamp(symbol_x))
 
 if not df_y.empty and not df_x.empty:
     
@@ -58,71 +202,57 @@ if not df_y.empty and not df_x.empty:
     common_idx = df_y.index.intersection(df_x.index)
     
     if len(common_idx) > window_size:
-        series_y = df_y.loc[common_idx]['close']
-        series_x = df_x.loc[common_idx]['close']
+        # Align once; analytics work on plain float arrays over common_idx
+        y_arr = df_y.loc[common_idx, 'close'].to_numpy(dtype=np.float64)
+        x_arr = df_x.loc[common_idx, 'close'].to_numpy(dtype=np.float64)
 
         # --- RUN ANALYTICS ---
-        hedge_ratio = calculate_ols_hedge_ratio(series_y, series_x)
-        spread = calculate_spread(series_y, series_x, hedge_ratio)
-        zscore = calculate_zscore(spread, window=window_size)
-        rolling_corr = calculate_rolling_correlation(series_y, series_x, window=window_size)
-        adf_res = perform_adf_test(spread)
+        data_key = DataKey(symbol_y, symbol_x, timeframe, len(common_idx),
+                           common_idx[0].value, common_idx[-1].value, y_arr[-1], x_arr[-1])
+        hedge_ratio = cached_hedge_ratio(y_arr, x_arr, data_key)
+        spread = calculate_spread(y_arr, x_arr, hedge_ratio, out=scratch_buffer('spread_buf', data_key.n))
+        zscore = calculate_zscore(spread, window=window_size, out=scratch_buffer('zscore_buf', data_key.n))
+        rolling_corr = cached_rolling_correlation(y_arr, x_arr, window_size, data_key)
+        adf_res = poll_adf_test(spread, data_key)
         
         # [Requirement: Backtest Strategy Extension]
-        backtest_df = run_backtest(spread, zscore, entry_threshold=z_threshold)
+        backtest_df = run_backtest(spread, zscore, entry_threshold=z_threshold, index=common_idx)
         total_pnl = backtest_df['cumulative_pnl'].iloc[-1]
         
         # [Requirement: Cross-correlation Heatmap Extension]
-        corr_matrix = pd.DataFrame({
-            symbol_y: series_y, 
-            symbol_x: series_x
-        }).pct_change().corr()
+        corr_matrix = calculate_returns_correlation(np.vstack((y_arr, x_arr)))
 
         # --- DISPLAY METRICS ---
         c1, c2, c3, c4 = st.columns(4)
         c1.metric("Hedge Ratio (Beta)", f"{hedge_ratio:.4f}")
-        c2.metric("Current Z-Score", f"{zscore.iloc[-1]:.2f}")
-        c3.metric("Current Correlation", f"{rolling_corr.iloc[-1]:.2f}")
+        c2.metric("Current Z-Score", f"{zscore[-1]:.2f}")
+        c3.metric("Current Correlation", f"{rolling_corr[-1]:.2f}")
         c4.metric("Strategy PnL (Sim)", f"{total_pnl:.4f}", delta_color="normal")
         
         if adf_res:
             st.caption(f"ADF Test: P-Value {adf_res['p_value']:.4f} | Stationary: {adf_res['is_stationary']}")
 
         # [Requirement: Alerting]
-        if abs(zscore.iloc[-1]) > z_threshold:
-            st.error(f"🚨 ALERT: Z-Score Breakout ({zscore.iloc[-1]:.2f}) exceeds threshold!")
+        if abs(zscore[-1]) > z_threshold:
+            st.error(f"🚨 ALERT: Z-Score Breakout ({zscore[-1]:.2f}) exceeds threshold!")
 
         # --- MAIN VISUALIZATION (5 ROWS) ---
         # [Requirement: Interactive visualizations]
-        fig = make_subplots(
-            rows=5, cols=1, 
-            shared_xaxes=True, 
-            vertical_spacing=0.03,
-            subplot_titles=(
-                "Price Action", 
-                "Spread (Residuals)", 
-                "Z-Score (Standardized)", 
-                "Rolling Correlation", 
-                "Backtest Cumulative PnL"
-            )
-        )
+        # The figure is built once per layout and kept in session_state; refreshes
+        # only swap the trace data, and uirevision keeps the user's zoom/pan.
+        fig_key = (symbol_y, symbol_x, z_threshold)
+        if st.session_state.get('main_fig_key') != fig_key:
+            st.session_state.main_fig = build_main_figure(symbol_y, symbol_x, z_threshold)
+            st.session_state.main_fig_key = fig_key
+        fig = st.session_state.main_fig
         
-        # 1. Price
-        fig.add_trace(go.Scatter(x=series_y.index, y=series_y, name=symbol_y), row=1, col=1)
-        fig.add_trace(go.Scatter(x=series_x.index, y=series_x, name=symbol_x), row=1, col=1)
-        # 2. Spread
-        fig.add_trace(go.Scatter(x=spread.index, y=spread, name="Spread", line=dict(color='orange')), row=2, col=1)
-        # 3. Z-Score
-        fig.add_trace(go.Scatter(x=zscore.index, y=zscore, name="Z-Score", line=dict(color='blue')), row=3, col=1)
-        fig.add_hline(y=z_threshold, line_dash="dash", line_color="red", row=3, col=1)
-        fig.add_hline(y=-z_threshold, line_dash="dash", line_color="red", row=3, col=1)
-        # 4. Correlation
-        fig.add_trace(go.Scatter(x=rolling_corr.index, y=rolling_corr, name="Corr", line=dict(color='purple')), row=4, col=1)
-        # 5. PnL
-        fig.add_trace(go.Scatter(x=backtest_df.index, y=backtest_df['cumulative_pnl'], name="PnL", fill='tozeroy', line=dict(color='green')), row=5, col=1)
+        trace_data = (y_arr, x_arr, spread, zscore, rolling_corr, backtest_df['cumulative_pnl'].to_numpy())
+        with fig.batch_update():
+            for trace, values in zip(fig.data, trace_data):
+                trace.x, trace.y = downsample(common_idx, values)
         
-        fig.update_layout(height=1100, template="plotly_dark", margin=dict(l=20, r=20, t=40, b=20))
-        st.plotly_chart(fig, use_container_width=True)
+        chart_slot = st.empty()
+        chart_slot.plotly_chart(fig, use_container_width=True, key="main_chart")
 
         # --- HEATMAP & TABLE ---
         col_left, col_right = st.columns([1, 2])
@@ -130,7 +260,8 @@ if not df_y.empty and not df_x.empty:
         with col_left:
             st.subheader("Correlation Heatmap")
             # [Requirement: Heatmap]
-            fig_heat = px.imshow(corr_matrix, text_auto=True, template="plotly_dark", height=300)
+            labels = [symbol_y, symbol_x]
+            fig_heat = px.imshow(corr_matrix, x=labels, y=labels, text_auto=True, template="plotly_dark", height=300)
             st.plotly_chart(fig_heat, use_container_width=True)
 
         with col_right:
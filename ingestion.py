@@ -1,81 +1,176 @@
 import asyncio
-import json
+import orjson
 import sqlite3
-import datetime
 from websockets import connect
 
+try:
+    # libuv-based event loop: less per-await overhead on the hot recv path.
+    # Not available on Windows, where we fall back to the default asyncio loop.
+    import uvloop
+except ImportError:
+    uvloop = None
+
 # --- CONFIGURATION ---
-BINANCE_WS_URL = "wss://fstream.binance.com/ws/"
+# Combined stream: one socket carries every symbol, wrapped as {"stream": ..., "data": ...}
+BINANCE_WS_URL = "wss://fstream.binance.com/stream?streams="
 DB_NAME = "market_data.db"
 # We track 4 symbols to allow for cross-correlation heatmaps
 SYMBOLS = ["btcusdt", "ethusdt", "solusdt", "bnbusdt"]
+# Trades are buffered and written in batches: whichever limit is hit first
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 0.25  # seconds
+
+# Rows are clustered by (symbol, timestamp) so each symbol's history is contiguous
+# on disk and the dashboard's "latest N ticks" query is a backward range scan.
+# timestamp is Binance's trade time in epoch milliseconds (UTC);
+# trade_id keeps trades that share a millisecond distinct.
+CREATE_TRADES_SQL = '''CREATE TABLE IF NOT EXISTS trades
+                 (symbol TEXT, timestamp INTEGER, trade_id INTEGER, price REAL, quantity REAL,
+                  PRIMARY KEY (symbol, timestamp, trade_id)) WITHOUT ROWID'''
+INSERT_TRADE_SQL = ("INSERT OR IGNORE INTO trades (symbol, timestamp, trade_id, price, quantity) "
+                    "VALUES (?, ?, ?, ?, ?)")
+
+# Single shared connection, opened once by init_db()
+conn = None
 
 def init_db():
     """
-    Creates the database table if it doesn't exist.
-    Schema: symbol (text), price (real), quantity (real), timestamp (datetime)
+    Opens the shared connection and creates the database table if it doesn't exist.
+    Schema: symbol (text), timestamp (integer, epoch ms), trade_id (integer), price (real), quantity (real)
     """
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS trades
-                 (symbol TEXT, price REAL, quantity REAL, timestamp DATETIME)''')
-    conn.commit()
-    conn.close()
+    global conn
+    # isolation_level=None: we manage BEGIN/COMMIT ourselves in save_trades()
+    conn = sqlite3.connect(DB_NAME, check_same_thread=False, isolation_level=None)
+    # WAL lets the dashboard read while we write; NORMAL only fsyncs at checkpoints
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")  # 256 MiB
+    conn.execute("PRAGMA cache_size=-65536")    # 64 MiB
+    migrate_legacy_table()
+    conn.execute(CREATE_TRADES_SQL)
     print(f"Database {DB_NAME} initialized successfully.")
 
-def save_trade(symbol, price, quantity, timestamp):
-    """Inserts a single trade tick into the SQLite database."""
+def migrate_legacy_table():
+    """
+    Rebuilds a trades table written by older versions into the current layout:
+    the heap layout (no trade_id, rowid-ordered) and/or datetime-text timestamps.
+    Legacy rows use their rowid as trade_id; text timestamps (naive local time,
+    as written by datetime.fromtimestamp) are converted to UTC epoch ms.
+    """
+    columns = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(trades)")}
+    if not columns or ('trade_id' in columns and columns['timestamp'] == 'INTEGER'):
+        return
+    
+    print("Migrating trades table to the current layout...")
+    trade_id = 'trade_id' if 'trade_id' in columns else 'rowid'
+    conn.execute("BEGIN")
+    conn.execute("ALTER TABLE trades RENAME TO trades_legacy")
+    conn.execute(CREATE_TRADES_SQL)
+    conn.execute(f"""INSERT OR IGNORE INTO trades (symbol, timestamp, trade_id, price, quantity)
+                     SELECT symbol,
+                            CASE WHEN typeof(timestamp) = 'text'
+                                 THEN CAST(ROUND((julianday(timestamp, 'utc') - 2440587.5) * 86400000) AS INTEGER)
+                                 ELSE timestamp END,
+                            {trade_id}, price, quantity
+                     FROM trades_legacy""")
+    # Also drops the old (symbol, timestamp) index, which the primary key replaces
+    conn.execute("DROP TABLE trades_legacy")
+    conn.execute("COMMIT")
+    # Reclaim the legacy table's pages so the rebuilt table is stored compactly.
+    # Must run outside a transaction, which isolation_level=None allows.
+    conn.execute("VACUUM")
+
+def save_trades(rows):
+    """Inserts a batch of trade ticks into the SQLite database in one transaction."""
     try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute("INSERT INTO trades (symbol, price, quantity, timestamp) VALUES (?, ?, ?, ?)",
-                  (symbol, price, quantity, timestamp))
-        conn.commit()
-        conn.close()
+        conn.execute("BEGIN")
+        # Same SQL string every call, so sqlite3's statement cache reuses the prepared statement
+        conn.executemany(INSERT_TRADE_SQL, rows)
+        conn.execute("COMMIT")
     except Exception as e:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
         print(f"DB Error: {e}")
 
-async def binance_listener(symbol):
+async def trade_flusher(queue):
+    """
+    Drains the trade queue and writes it to SQLite in batches of up to
+    BATCH_SIZE rows or FLUSH_INTERVAL seconds, whichever comes first.
+    """
+    loop = asyncio.get_running_loop()
+    batch = []
+    try:
+        while True:
+            batch.append(await queue.get())
+            deadline = loop.time() + FLUSH_INTERVAL
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            save_trades(batch)
+            batch = []
+    finally:
+        # Don't lose the partial batch on shutdown
+        if batch:
+            save_trades(batch)
+
+async def binance_listener(symbols, queue):
     """
-    Connects to Binance WebSocket for a specific symbol.
+    Connects to the Binance combined WebSocket stream for all symbols at once.
     Handles real-time stream and network reconnections.
     """
-    url = f"{BINANCE_WS_URL}{symbol.lower()}@trade"
+    url = BINANCE_WS_URL + "/".join(f"{symbol.lower()}@trade" for symbol in symbols)
     
     # Auto-reconnect loop
     while True:
         try:
             async with connect(url) as websocket:
-                print(f"✅ Connected to {symbol}")
+                print(f"✅ Connected to {', '.join(symbols)}")
                 while True:
                     message = await websocket.recv()
-                    data = json.loads(message)
+                    envelope = orjson.loads(message)
+                    data = envelope.get('data', {})
                     
                     # Parse only 'trade' events
                     if data.get('e') == 'trade':
+                        # Stream names look like "btcusdt@trade"
+                        symbol = envelope['stream'].split('@', 1)[0]
                         # Normalizing data [Requirement: Data Handling]
-                        # T = trade time (ms), p = price, q = quantity
-                        timestamp = datetime.datetime.fromtimestamp(data['T'] / 1000.0)
+                        # T = trade time (ms), t = trade id, p = price, q = quantity
+                        # Stored as-is: integer ms sort/compare cheaply and need no parsing on read
+                        timestamp = data['T']
                         price = float(data['p'])
                         quantity = float(data['q'])
                         
-                        save_trade(symbol, price, quantity, timestamp)
+                        # Hand off to the flusher instead of hitting the DB per tick
+                        queue.put_nowait((symbol, timestamp, data['t'], price, quantity))
                         
         except Exception as e:
-            print(f"⚠️ Connection error for {symbol}: {e}. Retrying in 5s...")
+            print(f"⚠️ Connection error: {e}. Retrying in 5s...")
             await asyncio.sleep(5) 
 
 async def main():
     """Main entry point for the Asyncio loop."""
     init_db()
-    # Create a listening task for every symbol in our list
-    tasks = [binance_listener(sym) for sym in SYMBOLS]
-    await asyncio.gather(*tasks)
+    queue = asyncio.Queue()
+    # One listener for all symbols, plus one DB writer
+    await asyncio.gather(binance_listener(SYMBOLS, queue), trade_flusher(queue))
 
 if __name__ == "__main__":
     try:
         print("Starting Ingestion Engine...")
-        asyncio.run(main())
+        if uvloop is not None:
+            uvloop.run(main())
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         print("Ingestion stopped by user.")
-        
\ No newline at end of file
+        